@@ -2,6 +2,7 @@
 Utility functions for ESP-IDF tools
 """
 import os
+import re
 import asyncio
 from typing import Tuple
 
@@ -90,3 +91,24 @@ async def list_serial_ports() -> Tuple[int, str, str]:
                        "/dev/cu.usbserial-*", "/dev/cu.SLAB_USBtoUART", "COM1", "COM2", "COM3"]
         port_info = "Common ESP device ports to try:\n" + "\n".join(common_ports)
         return 0, port_info, f"Note: Could not auto-detect ports. Error: {str(e)}"
+
+def get_idf_version(idf_path: str = None) -> str:
+    """Get the ESP-IDF version from tools/cmake/version.cmake
+
+    Args:
+        idf_path: Optional path to ESP-IDF directory. If None or empty, uses IDF_PATH environment variable.
+
+    Returns:
+        str: Version string such as "v5.2.1", or "unknown" if it cannot be determined
+    """
+    version_file = os.path.join(get_esp_idf_dir(idf_path), "tools", "cmake", "version.cmake")
+    parts = {}
+    try:
+        with open(version_file) as f:
+            for match in re.finditer(r"set\(IDF_VERSION_(MAJOR|MINOR|PATCH)\s+(\d+)\)", f.read()):
+                parts[match.group(1)] = match.group(2)
+    except OSError:
+        return "unknown"
+    if len(parts) != 3:
+        return "unknown"
+    return f"v{parts['MAJOR']}.{parts['MINOR']}.{parts['PATCH']}"
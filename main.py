@@ -6,6 +6,7 @@ from typing import Tuple
 from mcp.server.fastmcp import FastMCP
 import os
 from esp_utils import run_command_async, get_export_script, list_serial_ports, get_esp_idf_dir
+from template_cache import create_project_from_template, warm_project_template
 
 mcp = FastMCP("esp-mcp")
 
@@ -84,7 +85,7 @@ async def setup_project_esp_target(project_path: str, target: str, idf_path: str
 
 
 @mcp.tool()
-async def create_esp_project(project_path: str, project_name: str) -> Tuple[str, str]:
+async def create_esp_project(project_path: str, project_name: str, target: str = None, idf_path: str = None) -> Tuple[str, str]:
     """
     Creates a new ESP-IDF project for an ESP chip.
 
@@ -92,17 +93,74 @@ async def create_esp_project(project_path: str, project_name: str) -> Tuple[str,
         project_path (str): Path where the new ESP-IDF project will be created.
                             Must be located directly under the current working directory.
         project_name (str): Name of the ESP-IDF project to create.
+        target (str): Optional lowercase target name, such as 'esp32' or 'esp32c3'.
+                      - If None or empty: runs `idf.py create-project`, the first build compiles ESP-IDF from scratch.
+                      - If provided: copies a cached project that is already set to this target and built,
+                        so the first build is incremental. The cache is built on first use for each
+                        ESP-IDF version and target, see `warm_esp_project_template`.
+        idf_path: Path to ESP-IDF directory. Optional when IDF_PATH environment variable is set.
+                  - If None or empty: uses IDF_PATH environment variable
+                  - If provided: uses the specified path, allowing different projects to use different ESP-IDF versions.
 
     Returns:
-        Tuple[str, str]: A tuple containing the standard output and standard error messages.
+        Tuple[str, str]: A tuple containing the standard output and standard error messages. Time information is included in stdout.
     """
-    os.makedirs(project_path, exist_ok=True)
-    os.chdir(project_path)
-    export_script = get_export_script()
-    returncode, stdout, stderr = await run_command_async(f"bash -c 'source {export_script} && idf.py create-project --path {project_path} {project_name}'")
+    start_time = time.time()
+    processed_idf_path = idf_path if (idf_path and idf_path.strip()) else None
+    if target and target.strip():
+        returncode, stdout, stderr = await create_project_from_template(project_path, project_name, target.strip(), processed_idf_path)
+        # On failure no project directory is left behind
+        if returncode == 0:
+            os.chdir(project_path)
+    else:
+        os.makedirs(project_path, exist_ok=True)
+        os.chdir(project_path)
+        export_script = get_export_script(processed_idf_path)
+        returncode, stdout, stderr = await run_command_async(f"bash -c 'source {export_script} && idf.py create-project --path {project_path} {project_name}'")
+
+    # Calculate elapsed time
+    elapsed_time = time.time() - start_time
+    elapsed_minutes = int(elapsed_time // 60)
+    elapsed_seconds = elapsed_time % 60
+
+    # Add timing information to stdout
+    timing_info = f"\n\n[Project created in {elapsed_minutes}m {elapsed_seconds:.2f}s ({elapsed_time:.2f} seconds)]\n"
+    stdout_with_timing = stdout + timing_info
+
     open('mcp-project-root-path.log', 'w+').write(str((stdout, stderr)))
-    logging.warning(f"build result {stdout} {stderr}")
-    return stdout, stderr
+    logging.warning(f"create project result - elapsed: {elapsed_time:.2f}s, return code: {returncode}, stdout: {stdout[:200]}..., stderr: {stderr[:200]}...")
+    return stdout_with_timing, stderr
+
+
+@mcp.tool()
+async def warm_esp_project_template(target: str, idf_path: str = None) -> Tuple[str, str]:
+    """Create and build the cached project template used by `create_esp_project` for a target.
+
+    The template is keyed by ESP-IDF version, ESP-IDF path and target. Warming it ahead of time
+    moves the full ESP-IDF build out of the first `create_esp_project` call for that target.
+    The cache location can be changed with the ESP_MCP_TEMPLATE_CACHE environment variable.
+
+    Args:
+        target: Lowercase target name, such as 'esp32' or 'esp32c3'.
+        idf_path: Path to ESP-IDF directory. Optional when IDF_PATH environment variable is set.
+                  - If None or empty: uses IDF_PATH environment variable
+                  - If provided: uses the specified path, allowing different projects to use different ESP-IDF versions.
+
+    Returns:
+        tuple: (stdout, stderr) - Template build logs and error messages. Time information is included in stdout.
+    """
+    start_time = time.time()
+    returncode, stdout, stderr = await warm_project_template(target, idf_path if (idf_path and idf_path.strip()) else None)
+
+    # Calculate elapsed time
+    elapsed_time = time.time() - start_time
+    elapsed_minutes = int(elapsed_time // 60)
+    elapsed_seconds = elapsed_time % 60
+
+    # Add timing information to stdout
+    timing_info = f"\n\n[Template ready in {elapsed_minutes}m {elapsed_seconds:.2f}s ({elapsed_time:.2f} seconds)]\n"
+    logging.warning(f"warm template result - elapsed: {elapsed_time:.2f}s, return code: {returncode}, stdout: {stdout[-200:]}..., stderr: {stderr[:200]}...")
+    return stdout + timing_info, stderr
 
 
 @mcp.tool()
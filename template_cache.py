@@ -0,0 +1,386 @@
+"""
+Project template cache for ESP-IDF tools
+
+A template is a freshly created project that has already been set to a target
+and built once. It is keyed by ESP-IDF version, ESP-IDF checkout and target, so
+a new project can start from a copy of it and its first build is incremental
+instead of compiling the whole of ESP-IDF.
+
+ESP-IDF build directories hold absolute paths (CMake cache, ninja files, ninja
+logs), so a copied template is relocated to the new project path and renamed
+to the new project name before it is used.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shlex
+import shutil
+import struct
+import sys
+import tempfile
+from typing import Callable, Dict, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from esp_utils import run_command_async, get_esp_idf_dir, get_export_script, get_idf_version
+
+TEMPLATE_PROJECT_NAME = "esp_mcp_template"
+TEMPLATE_METADATA_FILE = "template.json"
+
+# ioctl(FICLONE) from linux/fs.h, shares file extents on btrfs, XFS, bcachefs...
+_FICLONE = 0x40049409 if sys.platform.startswith("linux") else None
+
+# Build outputs that are never relocated; other files are sniffed for NUL bytes.
+_BINARY_SUFFIXES = (".obj", ".o", ".a", ".elf", ".bin")
+_TEXT_SNIFF_SIZE = 8192
+
+_NINJA_DEPS_HEADER = b"# ninjadeps\n"
+_NINJA_LOG_HEADER = re.compile(rb"# ninja log v(\d+)")
+# Log versions whose command hash is MurmurHash64A, see ninja's build_log.cc
+_NINJA_LOG_MURMUR_VERSIONS = (5, 6)
+
+
+def get_template_cache_dir() -> str:
+    """Get the directory holding cached project templates
+
+    Returns:
+        str: ESP_MCP_TEMPLATE_CACHE if set, otherwise esp-mcp/templates under the user cache directory
+    """
+    # Tools chdir into projects, so a relative cache path must be resolved once here.
+    if os.environ.get("ESP_MCP_TEMPLATE_CACHE"):
+        return os.path.abspath(os.environ["ESP_MCP_TEMPLATE_CACHE"])
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.abspath(os.path.join(cache_home, "esp-mcp", "templates"))
+
+
+def get_template_dir(target: str, idf_path: str = None) -> str:
+    """Get the cache directory of the template for an ESP-IDF checkout and target
+
+    Args:
+        target: Lowercase target name, such as 'esp32' or 'esp32c3'.
+        idf_path: Optional path to ESP-IDF directory. If None or empty, uses IDF_PATH environment variable.
+
+    Returns:
+        str: Path of the template directory, which may not exist yet
+    """
+    idf_dir = os.path.realpath(get_esp_idf_dir(idf_path))
+    # The build directory embeds absolute ESP-IDF paths, so two checkouts of
+    # the same version cannot share a template.
+    idf_hash = hashlib.sha1(idf_dir.encode()).hexdigest()[:8]
+    return os.path.join(get_template_cache_dir(), f"{get_idf_version(idf_path)}-{idf_hash}-{target}")
+
+
+async def warm_project_template(target: str, idf_path: str = None) -> Tuple[int, str, str]:
+    """Create and build the project template for a target if it is not cached yet
+
+    Args:
+        target: Lowercase target name, such as 'esp32' or 'esp32c3'.
+        idf_path: Optional path to ESP-IDF directory. If None or empty, uses IDF_PATH environment variable.
+
+    Returns:
+        Tuple[int, str, str]: Return code, stdout, stderr
+    """
+    if not re.fullmatch(r"[a-z0-9]+", target or ""):
+        return 1, "", f"Invalid target name: {target!r}"
+    try:
+        template_dir = get_template_dir(target, idf_path)
+    except ValueError as e:
+        return 1, "", str(e)
+    if os.path.exists(os.path.join(template_dir, TEMPLATE_METADATA_FILE)):
+        return 0, f"Template already cached at {template_dir}\n", ""
+
+    # Build next to the final location and rename it into place once complete,
+    # so an interrupted or concurrent warm-up never leaves a partial template.
+    os.makedirs(os.path.dirname(template_dir), exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=os.path.basename(template_dir) + ".tmp-", dir=os.path.dirname(template_dir))
+    project_dir = os.path.join(work_dir, "project")
+    export_script = get_export_script(idf_path)
+    build_cmd = " && ".join([
+        f"source {shlex.quote(export_script)}",
+        f"idf.py create-project --path {shlex.quote(project_dir)} {TEMPLATE_PROJECT_NAME}",
+        f"idf.py -C {shlex.quote(project_dir)} set-target {target}",
+        f"idf.py -C {shlex.quote(project_dir)} build",
+    ])
+    try:
+        returncode, stdout, stderr = await run_command_async(f"bash -c {shlex.quote(build_cmd)}")
+        if returncode != 0:
+            return returncode, stdout, stderr
+
+        # Ninja hashes every command into .ninja_log; keep the template's
+        # commands so copies can rehash them for their own paths. The
+        # bootloader is a separate ninja build with its own log.
+        commands = {}
+        for dirpath, dirnames, filenames in os.walk(os.path.join(project_dir, "build")):
+            if "build.ninja" not in filenames:
+                continue
+            sub_build = os.path.relpath(dirpath, project_dir)
+            # export.sh prints progress to stdout, keep it out of the JSON
+            compdb_cmd = f"source {shlex.quote(export_script)} >/dev/null 2>&1 && ninja -C {shlex.quote(dirpath)} -t compdb"
+            returncode, compdb, compdb_stderr = await run_command_async(f"bash -c {shlex.quote(compdb_cmd)}")
+            try:
+                if returncode != 0:
+                    raise ValueError(f"ninja exited with {returncode}")
+                commands[sub_build] = _parse_compdb(compdb)
+            except ValueError as e:
+                # Without commands the copied logs cannot be rehashed and the
+                # first build would be a full one, so do not cache the template.
+                return 1, stdout, stderr + f"\nFailed to read ninja compdb for {sub_build}: {e}\n{compdb_stderr}"
+        if not commands.get("build"):
+            return 1, stdout, stderr + "\nninja compdb returned no commands for build\n"
+
+        metadata = {
+            # idf.py writes real paths into the CMake cache and ninja files.
+            "project_dir": os.path.realpath(project_dir),
+            "project_name": TEMPLATE_PROJECT_NAME,
+            "idf_path": os.path.realpath(get_esp_idf_dir(idf_path)),
+            "idf_version": get_idf_version(idf_path),
+            "target": target,
+            "commands": commands,
+        }
+        with open(os.path.join(work_dir, TEMPLATE_METADATA_FILE), "w") as f:
+            json.dump(metadata, f)
+        try:
+            os.rename(work_dir, template_dir)
+        except OSError:
+            # Another warm-up finished first, its template is just as good.
+            if not os.path.exists(os.path.join(template_dir, TEMPLATE_METADATA_FILE)):
+                raise
+        return 0, stdout + f"\nTemplate cached at {template_dir}\n", stderr
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+async def create_project_from_template(project_path: str, project_name: str, target: str,
+                                       idf_path: str = None) -> Tuple[int, str, str]:
+    """Create a project by copying the cached, pre-built template for a target
+
+    The template is warmed first when it is missing.
+
+    Args:
+        project_path: Path of the new project. Must not exist or be empty.
+        project_name: Name of the new project.
+        target: Lowercase target name, such as 'esp32' or 'esp32c3'.
+        idf_path: Optional path to ESP-IDF directory. If None or empty, uses IDF_PATH environment variable.
+
+    Returns:
+        Tuple[int, str, str]: Return code, stdout, stderr
+    """
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", project_name or ""):
+        return 1, "", f"Invalid project name: {project_name!r}"
+    if os.path.isdir(project_path) and os.listdir(project_path):
+        return 1, "", f"The directory {project_path} is not empty."
+
+    returncode, warm_stdout, warm_stderr = await warm_project_template(target, idf_path)
+    if returncode != 0:
+        return returncode, warm_stdout, warm_stderr
+
+    template_dir = get_template_dir(target, idf_path)
+    with open(os.path.join(template_dir, TEMPLATE_METADATA_FILE)) as f:
+        metadata = json.load(f)
+    try:
+        reflinked = await asyncio.to_thread(_instantiate_template, template_dir, metadata,
+                                            os.path.realpath(project_path), project_name)
+    except OSError as e:
+        return 1, warm_stdout, warm_stderr + f"Failed to copy template {template_dir}: {e}"
+
+    copy_mode = "reflinked" if reflinked else "copied"
+    stdout = warm_stdout + f"Project {project_name} {copy_mode} from template {template_dir} for {target}\n"
+    return 0, stdout, warm_stderr
+
+
+def _parse_compdb(output: str) -> list:
+    """Get the commands from `ninja -t compdb` output, skipping any lines printed before the JSON
+
+    Raises:
+        ValueError: If the output holds no valid compilation database
+    """
+    match = re.search(r"^\[", output, re.MULTILINE)
+    if not match:
+        raise ValueError("no compilation database in ninja output")
+    try:
+        return [entry["command"] for entry in json.loads(output[match.start():])]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"malformed compilation database: {e}")
+
+
+def _instantiate_template(template_dir: str, metadata: dict, project_dir: str, project_name: str) -> bool:
+    """Copy a template project to project_dir and relocate it there
+
+    Returns:
+        bool: True if every file was reflinked rather than copied
+    """
+    clone_file, reflinked = _make_clone_file()
+    shutil.copytree(os.path.join(template_dir, "project"), project_dir,
+                    symlinks=True, copy_function=clone_file, dirs_exist_ok=True)
+
+    old_dir, old_name = metadata["project_dir"].encode(), metadata["project_name"].encode()
+    replacements = {old_dir: project_dir.encode(), old_name: project_name.encode()}
+    pattern = re.compile(b"|".join(re.escape(old) for old in sorted(replacements, key=len, reverse=True)))
+
+    def relocate(data: bytes) -> bytes:
+        return pattern.sub(lambda m: replacements[m.group(0)], data)
+
+    # Only rehash commands that relocation changes in paths alone. A command
+    # mentioning the project name (e.g. esp_app_format's -DPROJECT_NAME) keeps
+    # its stale hash, so ninja rebuilds it with the new name.
+    sub_build_hashes = {}
+    for sub_build, commands in metadata.get("commands", {}).items():
+        hashes = sub_build_hashes[os.path.join(project_dir, sub_build)] = {}
+        for command in commands:
+            command = command.encode()
+            if old_name not in command.replace(old_dir, b""):
+                hashes[_murmur_hash_64a(command)] = _murmur_hash_64a(relocate(command))
+
+    for dirpath, dirnames, filenames in os.walk(project_dir, topdown=False):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.islink(path):
+                continue
+            if filename == ".ninja_deps":
+                _relocate_ninja_deps(path, relocate)
+            elif filename == ".ninja_log":
+                _relocate_ninja_log(path, relocate, sub_build_hashes.get(dirpath, {}))
+            else:
+                _relocate_text_file(path, relocate)
+        # Bottom-up walk, so renaming an entry never invalidates paths still to visit.
+        for name in filenames + dirnames:
+            new_name = relocate(name.encode()).decode()
+            if new_name != name:
+                os.rename(os.path.join(dirpath, name), os.path.join(dirpath, new_name))
+    return reflinked()
+
+
+def _make_clone_file() -> Tuple[Callable[[str, str], str], Callable[[], bool]]:
+    """Make a copy function sharing data blocks with the source when the filesystem supports reflinks
+
+    Reflink support is tracked per tree copy, since it depends on the
+    destination filesystem. Hardlinks are never used: compilers and editors
+    rewrite files in place, which would silently modify the cached template.
+
+    Returns:
+        tuple: (copy_function, reflinked) - reflinked() tells whether every file copied so far was reflinked
+    """
+    state = {"reflink": fcntl is not None and _FICLONE is not None, "copied": False}
+
+    def clone_file(src: str, dst: str) -> str:
+        if state["reflink"]:
+            try:
+                with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                    fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                shutil.copystat(src, dst)
+                return dst
+            except OSError:
+                state["reflink"] = False
+        state["copied"] = True
+        return shutil.copy2(src, dst)
+
+    return clone_file, lambda: not state["copied"]
+
+
+def _write_keeping_mtime(path: str, data: bytes) -> None:
+    """Rewrite a file without touching its timestamps, so ninja and CMake do not see it as changed"""
+    stat = os.stat(path)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def _relocate_text_file(path: str, relocate: Callable[[bytes], bytes]) -> None:
+    """Relocate paths in a text file, binary files are left untouched"""
+    if path.endswith(_BINARY_SUFFIXES):
+        return
+    with open(path, "rb") as f:
+        if b"\0" in f.read(_TEXT_SNIFF_SIZE):
+            return
+        f.seek(0)
+        data = f.read()
+    relocated = relocate(data)
+    if relocated != data:
+        _write_keeping_mtime(path, relocated)
+
+
+def _relocate_ninja_deps(path: str, relocate: Callable[[bytes], bytes]) -> None:
+    """Relocate the path records of a .ninja_deps file
+
+    Each record is a uint32 size followed by its payload. Deps records (high
+    bit set) only reference node ids and are kept as is. Path records are the
+    path padded with NULs to a multiple of 4 bytes, followed by a checksum
+    derived from the node id, which does not change.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = len(_NINJA_DEPS_HEADER) + 4
+    if not data.startswith(_NINJA_DEPS_HEADER) or len(data) < offset:
+        return
+
+    out = bytearray(data[:offset])
+    while offset + 4 <= len(data):
+        (size,) = struct.unpack_from("=I", data, offset)
+        is_deps = size & 0x80000000
+        size &= 0x7FFFFFFF
+        record = data[offset + 4:offset + 4 + size]
+        if len(record) < size or (not is_deps and size < 4):
+            # Truncated tail, ninja drops it on load as well.
+            break
+        offset += 4 + size
+        if not is_deps:
+            node_path = relocate(record[:-4].rstrip(b"\0"))
+            record = node_path + b"\0" * (-len(node_path) % 4) + record[-4:]
+        out += struct.pack("=I", len(record) | is_deps) + record
+    _write_keeping_mtime(path, bytes(out))
+
+
+def _relocate_ninja_log(path: str, relocate: Callable[[bytes], bytes], hashes: Dict[int, int]) -> None:
+    """Relocate the outputs of a .ninja_log file and rehash their commands
+
+    Entries whose command is not in hashes (for example edges using response
+    files) keep their old hash and are simply rebuilt by ninja.
+    """
+    with open(path, "rb") as f:
+        lines = f.read().split(b"\n")
+    header = _NINJA_LOG_HEADER.match(lines[0]) if lines else None
+    if not header:
+        return
+    rehash = int(header.group(1)) in _NINJA_LOG_MURMUR_VERSIONS
+
+    for i, line in enumerate(lines[1:], start=1):
+        fields = line.split(b"\t")
+        if len(fields) != 5:
+            continue
+        fields[3] = relocate(fields[3])
+        if rehash:
+            try:
+                command_hash = int(fields[4], 16)
+            except ValueError:
+                continue
+            fields[4] = b"%x" % hashes.get(command_hash, command_hash)
+        lines[i] = b"\t".join(fields)
+    _write_keeping_mtime(path, b"\n".join(lines))
+
+
+def _murmur_hash_64a(data: bytes) -> int:
+    """MurmurHash64A with ninja's seed, as used for .ninja_log command hashes"""
+    mask = 0xFFFFFFFFFFFFFFFF
+    m = 0xC6A4A7935BD1E995
+    r = 47
+    h = (0xDECAFBADDECAFBAD ^ (len(data) * m)) & mask
+    blocks_end = len(data) - len(data) % 8
+    for (k,) in struct.iter_unpack("<Q", data[:blocks_end]):
+        k = (k * m) & mask
+        k ^= k >> r
+        k = (k * m) & mask
+        h ^= k
+        h = (h * m) & mask
+    if blocks_end < len(data):
+        h ^= int.from_bytes(data[blocks_end:], "little")
+        h = (h * m) & mask
+    h ^= h >> r
+    h = (h * m) & mask
+    h ^= h >> r
+    return h
@@ -9,6 +9,9 @@ import asyncio
 import os
 import sys
 import logging
+import re
+import shutil
+import tempfile
 
 # Add parent directory to path to import main module
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -32,6 +35,7 @@ try:
         run_esp_idf_install,
         setup_project_esp_target,
         build_esp_project,
+        create_esp_project,
         run_pytest
     )
 except ImportError as e:
@@ -171,6 +175,71 @@ async def test_build_esp_project_with_sdkconfig_defaults():
         return False
 
 
+async def test_create_esp_project_from_template():
+    """Test create_esp_project with target, then its first build"""
+    print("=" * 80)
+    print("Test 3.6: create_esp_project from template cache")
+    print("=" * 80)
+    print(f"Target chip: {TARGET_CHIP}")
+    print(f"IDF path: {IDF_PATH}")
+    print("Note: The first run builds the template, later runs only copy it")
+    print()
+
+    original_dir = os.getcwd()
+    temp_dir = tempfile.mkdtemp(prefix="esp-mcp-test-")
+    try:
+        project_path = os.path.join(temp_dir, "template_project")
+        stdout, stderr = await create_esp_project(
+            project_path=project_path,
+            project_name="template_project",
+            target=TARGET_CHIP,
+            idf_path=IDF_PATH
+        )
+        print("Create STDOUT (last 500 chars):")
+        print(stdout[-500:] if len(stdout) > 500 else stdout)
+        print()
+        if stderr:
+            print("Create STDERR:")
+            print(stderr[-500:] if len(stderr) > 500 else stderr)
+
+        # The first build of a project copied from the template should be incremental
+        stdout, stderr = await build_esp_project(
+            project_path=project_path,
+            idf_path=IDF_PATH
+        )
+        print("First build STDOUT (last 500 chars):")
+        print(stdout[-500:] if len(stdout) > 500 else stdout)
+        print()
+        if stderr:
+            print("First build STDERR:")
+            print(stderr[-500:] if len(stderr) > 500 else stderr)
+
+        if not os.path.exists(os.path.join(project_path, "build", "template_project.bin")):
+            print("✗ template_project.bin not found in build directory")
+            return False
+
+        # Only the app's own sources and esp_app_format (which embeds the
+        # project name) should be compiled, everything else comes from the template
+        compiled = re.findall(r"Building (?:C|CXX|ASM) object (\S+)", stdout)
+        rebuilt = [obj for obj in compiled if "esp_app_format" not in obj and "main/" not in obj]
+        print(f"Objects compiled by first build: {len(compiled)}")
+        if rebuilt:
+            print(f"✗ First build was not incremental, rebuilt {len(rebuilt)} objects, e.g.:")
+            print("\n".join(rebuilt[:10]))
+            return False
+
+        print("✓ Create from template test completed")
+        return True
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
 async def test_run_pytest():
     """Test run_pytest function"""
     print("=" * 80)
@@ -246,6 +315,11 @@ async def main():
     results.append(("build_esp_project (with sdkconfig_defaults)", result3_5))
     print()
 
+    # Test 3.6: Create project from template cache and build it
+    result3_6 = await test_create_esp_project_from_template()
+    results.append(("create_esp_project (template)", result3_6))
+    print()
+
     # Test 4: Run pytest
     result4 = await test_run_pytest()
     results.append(("run_pytest", result4))
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the template cache.
+
+These tests cover the ninja file formats and the warm-up bookkeeping and do not need ESP-IDF.
+"""
+import asyncio
+import json
+import os
+import struct
+import sys
+
+import pytest
+
+# Add parent directory to path to import template_cache module
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import template_cache
+from template_cache import (
+    _instantiate_template,
+    _parse_compdb,
+    _murmur_hash_64a,
+    _relocate_ninja_deps,
+    _relocate_ninja_log,
+)
+
+
+def _relocate(data):
+    return data.replace(b"/old/project", b"/new/longer/project")
+
+
+def _path_record(path, node_id):
+    path = path.encode() + b"\0" * (-len(path) % 4)
+    return struct.pack("=I", len(path) + 4) + path + struct.pack("=I", ~node_id & 0xFFFFFFFF)
+
+
+def _deps_record(out_id, mtime, dep_ids):
+    payload = struct.pack("=iII", out_id, mtime & 0xFFFFFFFF, mtime >> 32)
+    payload += b"".join(struct.pack("=i", dep_id) for dep_id in dep_ids)
+    return struct.pack("=I", len(payload) | 0x80000000) + payload
+
+
+def _read_deps_paths(data):
+    paths, offset = [], len(b"# ninjadeps\n") + 4
+    while offset < len(data):
+        (size,) = struct.unpack_from("=I", data, offset)
+        record = data[offset + 4:offset + 4 + (size & 0x7FFFFFFF)]
+        offset += 4 + (size & 0x7FFFFFFF)
+        if not size & 0x80000000:
+            assert len(record) % 4 == 0
+            (checksum,) = struct.unpack("=I", record[-4:])
+            paths.append((record[:-4].rstrip(b"\0").decode(), ~checksum & 0xFFFFFFFF))
+    return paths
+
+
+def test_murmur_hash_64a_matches_ninja():
+    # Hashes written to .ninja_log (v5) by ninja 1.11 for these commands
+    assert _murmur_hash_64a(b"touch a") == 0x9544b174230a39b3
+    assert _murmur_hash_64a(b"touch b && echo hello world") == 0xf2ec92161ce2c0c2
+
+
+def test_relocate_ninja_deps(tmp_path):
+    deps = tmp_path / ".ninja_deps"
+    deps_record = _deps_record(0, 123456789012, [1])
+    deps.write_bytes(b"# ninjadeps\n" + struct.pack("=i", 4)
+                     + _path_record("esp-idf/main/a.obj", 0)
+                     + _path_record("/old/project/build/config/sdkconfig.h", 1)
+                     + deps_record)
+    os.utime(deps, ns=(1, 1000))
+
+    _relocate_ninja_deps(str(deps), _relocate)
+
+    data = deps.read_bytes()
+    assert _read_deps_paths(data) == [
+        ("esp-idf/main/a.obj", 0),
+        ("/new/longer/project/build/config/sdkconfig.h", 1),
+    ]
+    assert data.endswith(deps_record)
+    assert os.stat(deps).st_mtime_ns == 1000
+
+
+def test_relocate_ninja_log(tmp_path):
+    log = tmp_path / ".ninja_log"
+    log.write_bytes(b"# ninja log v5\n"
+                    b"0\t1\t2\tesp-idf/main/a.obj\t1a\n"
+                    b"0\t1\t2\t/old/project/build/x.bin\t2b\n")
+
+    _relocate_ninja_log(str(log), _relocate, {0x1a: 0xffff})
+
+    assert log.read_bytes() == (b"# ninja log v5\n"
+                                b"0\t1\t2\tesp-idf/main/a.obj\tffff\n"
+                                b"0\t1\t2\t/new/longer/project/build/x.bin\t2b\n")
+
+
+def test_relocate_ninja_log_unknown_version_keeps_hashes(tmp_path):
+    log = tmp_path / ".ninja_log"
+    log.write_bytes(b"# ninja log v7\n0\t1\t2\t/old/project/a.obj\t1a\n")
+
+    _relocate_ninja_log(str(log), _relocate, {0x1a: 0xffff})
+
+    assert log.read_bytes() == b"# ninja log v7\n0\t1\t2\t/new/longer/project/a.obj\t1a\n"
+
+
+def test_instantiate_template(tmp_path):
+    old_dir = str(tmp_path / "tmpl" / "project")
+    new_dir = str(tmp_path / "hello-world")
+    path_command = f"gcc -I{old_dir}/build/config -c a.c"
+    name_command = f'gcc -DPROJECT_NAME="esp_mcp_template" -I{old_dir}/build/config -c esp_app_desc.c'
+    boot_command = f"gcc -I{old_dir}/build/bootloader/config -c b.c"
+
+    files = {
+        "CMakeLists.txt": b"project(esp_mcp_template)\n",
+        "main/esp_mcp_template.c": b"void app_main(void) {}\n",
+        "build/CMakeCache.txt": f"CMAKE_HOME_DIRECTORY:INTERNAL={old_dir}\n".encode(),
+        "build/esp_mcp_template.elf": b"\x7fELF\0" + old_dir.encode(),
+        "build/.ninja_log": (f"# ninja log v5\n"
+                             f"0\t1\t2\ta.obj\t{_murmur_hash_64a(path_command.encode()):x}\n"
+                             f"0\t1\t2\tesp_app_desc.obj\t{_murmur_hash_64a(name_command.encode()):x}\n").encode(),
+        "build/bootloader/.ninja_log": f"# ninja log v5\n0\t1\t2\tb.obj\t{_murmur_hash_64a(boot_command.encode()):x}\n".encode(),
+        "build/bootloader/.ninja_deps": (b"# ninjadeps\n" + struct.pack("=i", 4)
+                                         + _path_record(f"{old_dir}/build/bootloader/config/sdkconfig.h", 0)),
+    }
+    for name, content in files.items():
+        path = os.path.join(old_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        os.utime(path, ns=(1, 1000))
+
+    metadata = {
+        "project_dir": old_dir,
+        "project_name": "esp_mcp_template",
+        "commands": {"build": [path_command, name_command], "build/bootloader": [boot_command]},
+    }
+    _instantiate_template(str(tmp_path / "tmpl"), metadata, new_dir, "hello-world")
+
+    def read(name):
+        with open(os.path.join(new_dir, name), "rb") as f:
+            return f.read()
+
+    assert read("CMakeLists.txt") == b"project(hello-world)\n"
+    assert read("main/hello-world.c") == b"void app_main(void) {}\n"
+    assert read("build/CMakeCache.txt") == f"CMAKE_HOME_DIRECTORY:INTERNAL={new_dir}\n".encode()
+    assert os.stat(os.path.join(new_dir, "build/CMakeCache.txt")).st_mtime_ns == 1000
+    # Binaries are only renamed, never rewritten
+    assert read("build/hello-world.elf") == files["build/esp_mcp_template.elf"]
+
+    # Path-only commands are rehashed, commands naming the project keep their stale hash
+    new_path_command = path_command.replace(old_dir, new_dir)
+    assert read("build/.ninja_log") == (f"# ninja log v5\n"
+                                        f"0\t1\t2\ta.obj\t{_murmur_hash_64a(new_path_command.encode()):x}\n"
+                                        f"0\t1\t2\tesp_app_desc.obj\t{_murmur_hash_64a(name_command.encode()):x}\n").encode()
+
+    # Sub-builds use their own command database
+    new_boot_command = boot_command.replace(old_dir, new_dir)
+    assert read("build/bootloader/.ninja_log") == (
+        f"# ninja log v5\n0\t1\t2\tb.obj\t{_murmur_hash_64a(new_boot_command.encode()):x}\n".encode())
+    assert _read_deps_paths(read("build/bootloader/.ninja_deps")) == [
+        (f"{new_dir}/build/bootloader/config/sdkconfig.h", 0)]
+
+    # The template itself is left untouched
+    with open(os.path.join(old_dir, "CMakeLists.txt"), "rb") as f:
+        assert f.read() == files["CMakeLists.txt"]
+
+
+EXPORT_NOISE = ("Detecting the Python interpreter\n"
+                "Checking \"python3\" ...\n"
+                "Done! You can now compile ESP-IDF projects.\n")
+COMPDB = json.dumps([{"directory": "/p/build", "command": "gcc -c a.c", "file": "a.c", "output": "a.obj"}])
+
+
+def test_parse_compdb_skips_leading_noise():
+    assert _parse_compdb(EXPORT_NOISE + COMPDB) == ["gcc -c a.c"]
+
+
+def test_parse_compdb_without_json():
+    with pytest.raises(ValueError):
+        _parse_compdb(EXPORT_NOISE)
+    with pytest.raises(ValueError):
+        _parse_compdb(EXPORT_NOISE + "[{]")
+
+
+def _fake_idf(tmp_path, monkeypatch, compdb_result):
+    idf_dir = tmp_path / "esp-idf"
+    idf_dir.mkdir()
+    monkeypatch.setenv("ESP_MCP_TEMPLATE_CACHE", str(tmp_path / "cache"))
+
+    async def run_command_async(command):
+        if "-t compdb" in command:
+            return compdb_result
+        # Stand in for create-project, set-target and build
+        project_dir = command.split("create-project --path ")[1].split()[0]
+        os.makedirs(os.path.join(project_dir, "build"))
+        open(os.path.join(project_dir, "build", "build.ninja"), "w").close()
+        return 0, "built\n", ""
+
+    monkeypatch.setattr(template_cache, "run_command_async", run_command_async)
+    return str(idf_dir)
+
+
+def test_warm_project_template_with_export_noise(tmp_path, monkeypatch):
+    idf_path = _fake_idf(tmp_path, monkeypatch, (0, EXPORT_NOISE + COMPDB, ""))
+
+    returncode, stdout, stderr = asyncio.run(template_cache.warm_project_template("esp32c3", idf_path))
+
+    assert returncode == 0, stderr
+    with open(os.path.join(template_cache.get_template_dir("esp32c3", idf_path), "template.json")) as f:
+        assert json.load(f)["commands"] == {"build": ["gcc -c a.c"]}
+
+
+@pytest.mark.parametrize("compdb_result", [(1, "", "ninja: error"), (0, EXPORT_NOISE, ""), (0, "[]", "")])
+def test_warm_project_template_compdb_failure_is_not_cached(tmp_path, monkeypatch, compdb_result):
+    idf_path = _fake_idf(tmp_path, monkeypatch, compdb_result)
+
+    returncode, stdout, stderr = asyncio.run(template_cache.warm_project_template("esp32c3", idf_path))
+
+    assert returncode != 0
+    assert os.listdir(template_cache.get_template_cache_dir()) == []